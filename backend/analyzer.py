@@ -1,11 +1,12 @@
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Any, Optional
 import jieba
 import re
 import math
-from collections import Counter
+import threading
+from collections import Counter, OrderedDict
 from config import Config
 
 # 尝试导入lz4
@@ -18,16 +19,119 @@ except ImportError:
     HAS_LZ4 = False
     print("⚠ LZ4未安装，部分压缩消息可能无法完整解析")
 
+# 尝试导入pyahocorasick（可选，用于情感词多模式匹配）
+try:
+    import ahocorasick
+
+    HAS_AHOCORASICK = True
+except ImportError:
+    HAS_AHOCORASICK = False
+
+# 预先加载jieba词典，避免首次评分时的加载开销
+jieba.initialize()
+
+# emoji匹配正则（模块加载时编译一次）
+_EMOJI_RE = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U00002700-\U000027BF]')
+
+# 保留的主要消息类型：文本、图片、语音、视频、表情包、分享/引用
+MESSAGE_TYPES = (1, 3, 34, 43, 47, 49)
+
+# 情感词表
+POSITIVE_WORDS = frozenset(['哈哈', '嘿嘿', '哈哈哈', '好', '棒', '赞', '开心', '快乐',
+                            '爱', '喜欢', '谢谢', '感谢', '么么', '亲', '抱抱', '❤'])
+NEGATIVE_WORDS = frozenset(['唉', '难过', '烦', '生气', '讨厌', '糟糕', '失望', '难受'])
+
+
+def _build_automaton(words):
+    """构建Aho-Corasick自动机，pyahocorasick不可用时返回None"""
+    if not HAS_AHOCORASICK:
+        return None
+    automaton = ahocorasick.Automaton()
+    for word in words:
+        automaton.add_word(word, word)
+    automaton.make_automaton()
+    return automaton
+
+
+_POS_AC = _build_automaton(POSITIVE_WORDS)
+_NEG_AC = _build_automaton(NEGATIVE_WORDS)
+
+
+def _count_present_words(messages, words, automaton=None):
+    """统计消息中出现过的词语种类数（每个词最多计一次）"""
+    if automaton is None:
+        sample_text = ' '.join(messages)
+        return sum(1 for word in words if word in sample_text)
+
+    found = set()
+    for msg in messages:
+        found.update(word for _, word in automaton.iter(msg))
+        if len(found) == len(words):
+            break
+    return len(found)
+
+
+# 1970-01-01 的日期序数，用于 datetime64[D] 与 date.toordinal() 互转
+EPOCH_ORD = date(1970, 1, 1).toordinal()
+
+
+def _max_streaks(dates_ord, gaps):
+    """
+    计算多个间隔阈值下的最长连续天数（只做一次差分）
+    dates_ord: 升序去重的日期序数（int64数组）
+    gaps: 间隔阈值，相邻日期间隔不超过该天数即视为连续
+    返回 {gap: (最长连续天数, 起始下标, 结束下标)}，并列时取最早的一段
+    """
+    if len(dates_ord) == 0:
+        return {gap: (1, 0, 0) for gap in gaps}
+
+    diffs = np.diff(dates_ord)
+    streaks = {}
+    for gap in gaps:
+        # 间隔超过gap处断开，得到各连续段的起止下标
+        splits = np.flatnonzero(diffs > gap) + 1
+        starts = np.concatenate(([0], splits))
+        ends = np.concatenate((splits, [len(dates_ord)]))
+        lens = ends - starts
+
+        best = int(lens.argmax())
+        streaks[gap] = (int(lens[best]), int(starts[best]), int(ends[best]) - 1)
+    return streaks
+
 
 class RelationAnalyzer:
+    # 评分结果缓存的最大条目数
+    CACHE_SIZE = 32
+
     def __init__(self):
         self.config = Config()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()  # 接口会在多个线程中并发调用calculate_rscore
+
+    def _fingerprint(self, df: pd.DataFrame):
+        """
+        计算消息数据的轻量指纹，用作评分缓存的键；无法计算时返回None
+        指纹只包含条数、首尾时间和（发送方, 类型）的哈希和，不区分行顺序和消息内容，
+        仅用于识别同一联系人的重复请求；新鲜度依赖当天日期，因此键中包含当天的日期序数
+        """
+        try:
+            return (
+                date.today().toordinal(),
+                len(df),
+                int(pd.Timestamp(df['CreateTime'].iloc[0]).value),
+                int(pd.Timestamp(df['CreateTime'].iloc[-1]).value),
+                int(pd.util.hash_pandas_object(df[['IsSender', 'Type']], index=False).sum())
+            )
+        except Exception:
+            return None
 
     def _safe_value(self, value):
         """确保值不是NaN或无穷大"""
-        if pd.isna(value) or np.isnan(value) or np.isinf(value):
+        try:
+            v = float(value)
+        except (TypeError, ValueError):
             return 0.0
-        return float(value)
+        return v if math.isfinite(v) else 0.0
 
     def _logarithmic_scale(self, value, target, steepness=1.0):
         """
@@ -88,11 +192,38 @@ class RelationAnalyzer:
         else:
             return "失联"
 
+    def calculate_rscore_arrays(self, create_time: np.ndarray, is_sender: np.ndarray, msg_type: np.ndarray,
+                                sub_type: np.ndarray, str_content: np.ndarray,
+                                compress_content: Optional[np.ndarray] = None) -> Dict:
+        """
+        按列数组计算关系评分（批量评分使用）
+        只用评分需要的列组装新的DataFrame，不会修改调用方的数据
+        """
+        columns = {
+            'CreateTime': create_time,
+            'IsSender': is_sender,
+            'Type': msg_type,
+            'SubType': sub_type,
+            'StrContent': str_content,
+        }
+        if compress_content is not None:
+            columns['CompressContent'] = compress_content
+        return self.calculate_rscore(pd.DataFrame(columns, copy=False))
+
     def calculate_rscore(self, messages_df: pd.DataFrame) -> Dict:
         """计算关系评分 - 包含新鲜度调整"""
         if messages_df.empty:
             return self._empty_result()
 
+        # 相同数据重复请求时直接返回缓存结果
+        cache_key = self._fingerprint(messages_df)
+        if cache_key is not None:
+            with self._cache_lock:
+                cached = self._cache.get(cache_key)
+                if cached is not None:
+                    self._cache.move_to_end(cache_key)
+                    return dict(cached)
+
         try:
             # 预处理数据
             messages_df = self._preprocess_messages(messages_df)
@@ -103,14 +234,34 @@ class RelationAnalyzer:
             # 计算基础统计
             stats = self._calculate_statistics(messages_df)
 
+            # 一次扫描统计各消息类型数量，供情感、深度评分复用（不放入stats，stats会原样返回给前端）
+            type_arr = messages_df['Type'].to_numpy()
+            type_counts = {t: int((type_arr == t).sum()) for t in MESSAGE_TYPES}
+
             # 计算关系成熟度（0-1），用于调节最终得分
             maturity = self._calculate_maturity(messages_df, stats)
 
+            # 文本消息及其长度只提取一次，供各评分函数复用
+            text_messages = messages_df.loc[messages_df['Type'].values == 1, 'Content'].dropna()
+            text_lengths = text_messages.str.len().to_numpy()
+
+            # 按小时统计消息数（24个桶），供内容评分和里程碑复用
+            hour_counts = np.bincount(messages_df['_Hour'].to_numpy(), minlength=24)
+
+            # 按日期统计消息数（升序日期序数及对应条数），供互动、深度评分和里程碑复用
+            day_ords, day_counts = np.unique(messages_df['_DateOrd'].to_numpy(), return_counts=True)
+
+            # 最长连续天数：互动评分按间隔≤2天，里程碑按间隔≤1天
+            streaks = _max_streaks(day_ords, (1, 2))
+
             # 计算各维度得分（新算法）
-            interaction_score = self._calculate_interaction_score_v2(messages_df, stats, maturity)
-            content_score = self._calculate_content_score_v2(messages_df, stats)
-            emotion_score = self._calculate_emotion_score_v2(messages_df, stats)
-            depth_score = self._calculate_depth_score_v2(messages_df, stats)
+            interaction_score = self._calculate_interaction_score_v2(messages_df, stats, maturity, day_ords,
+                                                                     streaks[2])
+            content_score = self._calculate_content_score_v2(messages_df, stats, text_messages, text_lengths,
+                                                             hour_counts)
+            emotion_score = self._calculate_emotion_score_v2(messages_df, stats, text_messages, type_counts)
+            depth_score = self._calculate_depth_score_v2(messages_df, stats, text_messages, text_lengths,
+                                                         day_counts, type_counts)
 
             # 新的权重分配
             weights = {
@@ -149,9 +300,9 @@ class RelationAnalyzer:
             final_score = self._score_mapping(final_score)
 
             # 提取里程碑
-            milestones = self._extract_milestones(messages_df)
+            milestones = self._extract_milestones(messages_df, hour_counts, day_ords, day_counts, streaks[1])
 
-            return {
+            result = {
                 "total_score": round(final_score, 2),
                 "dimensions": {
                     "interaction": round(interaction_score['total'] * 10, 2),
@@ -175,6 +326,14 @@ class RelationAnalyzer:
                 "relationship_status": relationship_status,
                 "freshness": round(freshness, 2)
             }
+
+            if cache_key is not None:
+                with self._cache_lock:
+                    self._cache[cache_key] = result
+                    if len(self._cache) > self.CACHE_SIZE:
+                        self._cache.popitem(last=False)
+
+            return dict(result)
         except Exception as e:
             print(f"计算评分时出错: {e}")
             return self._empty_result()
@@ -195,7 +354,8 @@ class RelationAnalyzer:
 
         return min(maturity, 1.0)
 
-    def _calculate_interaction_score_v2(self, df: pd.DataFrame, stats: Dict, maturity: float) -> Dict:
+    def _calculate_interaction_score_v2(self, df: pd.DataFrame, stats: Dict, maturity: float,
+                                        day_ords: np.ndarray, streak: tuple) -> Dict:
         """计算互动维度得分 - 新版本"""
         details = {}
 
@@ -217,20 +377,11 @@ class RelationAnalyzer:
             details['total_messages'] = total_messages
 
             # 2. 持续性（活跃天数比例 + 连续性）
-            active_days = df.groupby(df['CreateTime'].dt.date).size().shape[0]
+            active_days = len(day_ords)
             active_ratio = active_days / max(stats['total_days'], 1)
 
-            # 计算最长连续天数
-            dates = sorted(df['CreateTime'].dt.date.unique())
-            max_streak = 1
-            current_streak = 1
-
-            for i in range(1, len(dates)):
-                if (dates[i] - dates[i - 1]).days <= 2:
-                    current_streak += 1
-                    max_streak = max(max_streak, current_streak)
-                else:
-                    current_streak = 1
+            # 最长连续天数（间隔≤2天视为连续）
+            max_streak = streak[0]
 
             # 持续性评分
             continuity_score = active_ratio * 0.5 + min(max_streak / 30, 1.0) * 0.5
@@ -240,8 +391,8 @@ class RelationAnalyzer:
             details['max_streak'] = max_streak
 
             # 3. 响应活跃度（回复速度和双向性）
-            sent_messages = len(df[df['IsSender'] == 1])
-            received_messages = len(df[df['IsSender'] == 0])
+            sent_messages = stats['sent_messages']
+            received_messages = stats['received_messages']
 
             # 双向平衡度（越接近1:1越好）
             if sent_messages > 0 and received_messages > 0:
@@ -249,15 +400,15 @@ class RelationAnalyzer:
             else:
                 balance = 0
 
-            # 计算平均响应时间
-            response_times = []
-            for i in range(1, min(len(df), 500)):
-                if df.iloc[i]['IsSender'] != df.iloc[i - 1]['IsSender']:
-                    time_diff = (df.iloc[i]['CreateTime'] - df.iloc[i - 1]['CreateTime']).seconds
-                    if 0 < time_diff < 3600:
-                        response_times.append(time_diff)
+            # 计算平均响应时间（前500条，发送方切换处的时间差）
+            n = min(len(df), 500)
+            sender_arr = df['IsSender'].to_numpy()[:n]
+            t_arr = df['CreateTime'].to_numpy()[:n].astype('datetime64[s]').astype(np.int64)
+            switch = sender_arr[1:] != sender_arr[:-1]
+            dt = t_arr[1:] - t_arr[:-1]
+            response_times = dt[switch & (dt > 0) & (dt < 3600)]
 
-            if response_times:
+            if response_times.size > 0:
                 avg_response = np.median(response_times)
                 response_score = self._logarithmic_scale(300 / max(avg_response, 60), 1, 2)
             else:
@@ -284,18 +435,16 @@ class RelationAnalyzer:
             print(f"计算互动分数时出错: {e}")
             return {'total': 0.0, 'details': details}
 
-    def _calculate_content_score_v2(self, df: pd.DataFrame, stats: Dict) -> Dict:
+    def _calculate_content_score_v2(self, df: pd.DataFrame, stats: Dict, text_messages: pd.Series,
+                                    lengths: np.ndarray, hour_counts: np.ndarray) -> Dict:
         """计算内容维度得分 - 新版本"""
         details = {}
 
         try:
-            text_messages = df[df['Type'] == 1]['Content'].dropna()
-
             if text_messages.empty:
                 return {'total': 0.0, 'details': details}
 
             # 1. 消息深度（长度分布）
-            lengths = text_messages.str.len()
             avg_length = lengths.mean()
 
             # 计算有深度的消息比例（超过20字）
@@ -311,13 +460,17 @@ class RelationAnalyzer:
             details['avg_message_length'] = round(avg_length, 2)
             details['meaningful_ratio'] = round(meaningful_ratio, 3)
 
-            # 2. 话题丰富度
-            all_text = ' '.join(text_messages.astype(str))[:200000]
-            words = jieba.lcut(all_text)
+            # 2. 话题丰富度（逐条分词，最多处理约20万字）
+            word_freq = Counter()
+            budget = 200000
+            for text in text_messages:
+                budget -= len(text)
+                # 过滤单字词
+                word_freq.update(w for w in jieba.cut(text) if len(w) > 1)
+                if budget <= 0:
+                    break
 
-            # 过滤停用词和高频词
-            word_freq = Counter(w for w in words if len(w) > 1)
-            unique_topics = len([w for w, c in word_freq.items() if c >= 3])
+            unique_topics = sum(1 for c in word_freq.values() if c >= 3)
 
             # 话题得分（200个话题良好，500个优秀）
             topic_score = self._logarithmic_scale(unique_topics, 300, 1.0)
@@ -325,13 +478,10 @@ class RelationAnalyzer:
             details['unique_topics'] = unique_topics
 
             # 3. 时间分布（全天候交流）
-            df['Hour'] = df['CreateTime'].dt.hour
-            hour_distribution = df['Hour'].value_counts()
-            active_hours = len(hour_distribution[hour_distribution >= 5])
+            active_hours = int((hour_counts >= 5).sum())
 
-            # 深夜交流（显示亲密）
-            late_night = df[(df['Hour'] >= 0) & (df['Hour'] <= 6)]
-            late_night_ratio = len(late_night) / len(df)
+            # 深夜交流（0-6点，显示亲密）
+            late_night_ratio = float(hour_counts[:7].sum()) / len(df)
 
             # 时间分布得分
             time_score = (
@@ -355,27 +505,19 @@ class RelationAnalyzer:
             print(f"计算内容分数时出错: {e}")
             return {'total': 0.0, 'details': details}
 
-    def _calculate_emotion_score_v2(self, df: pd.DataFrame, stats: Dict) -> Dict:
+    def _calculate_emotion_score_v2(self, df: pd.DataFrame, stats: Dict, text_messages: pd.Series,
+                                    type_counts: Dict[int, int]) -> Dict:
         """计算情感维度得分 - 新版本"""
         details = {}
 
         try:
-            text_messages = df[df['Type'] == 1]['Content'].fillna('')
-
             if text_messages.empty:
                 return {'total': 0.5, 'details': details}
 
             # 1. 表情使用（emoji + 表情包）
-            emoji_pattern = re.compile(r'[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U00002700-\U000027BF]')
-
-            emoji_messages = 0
-            total_emojis = 0
-
-            for msg in text_messages[:1000]:
-                emojis = emoji_pattern.findall(str(msg))
-                if emojis:
-                    emoji_messages += 1
-                    total_emojis += len(emojis)
+            emoji_counts = text_messages.head(1000).str.count(_EMOJI_RE)
+            emoji_messages = int((emoji_counts > 0).sum())
+            total_emojis = int(emoji_counts.sum())
 
             emoji_usage_ratio = emoji_messages / min(len(text_messages), 1000)
             emoji_density = total_emojis / min(len(text_messages), 1000)
@@ -389,15 +531,10 @@ class RelationAnalyzer:
             details['emoji_usage_ratio'] = round(emoji_usage_ratio, 3)
             details['emoji_density'] = round(emoji_density, 3)
 
-            # 2. 情感词汇
-            positive_words = set(['哈哈', '嘿嘿', '哈哈哈', '好', '棒', '赞', '开心', '快乐',
-                                  '爱', '喜欢', '谢谢', '感谢', '么么', '亲', '抱抱', '❤'])
-            negative_words = set(['唉', '难过', '烦', '生气', '讨厌', '糟糕', '失望', '难受'])
-
-            sample_text = ' '.join(text_messages.astype(str)[:500])
-
-            positive_count = sum(1 for word in positive_words if word in sample_text)
-            negative_count = sum(1 for word in negative_words if word in sample_text)
+            # 2. 情感词汇（统计前500条中出现过的情感词种类数）
+            sample = text_messages.head(500)
+            positive_count = _count_present_words(sample, POSITIVE_WORDS, _POS_AC)
+            negative_count = _count_present_words(sample, NEGATIVE_WORDS, _NEG_AC)
 
             # 情感积极度
             if positive_count + negative_count > 0:
@@ -421,11 +558,11 @@ class RelationAnalyzer:
                 47: 'emoji'
             }
 
-            media_msgs = df[df['Type'].isin(media_types.keys())]
-            media_ratio = len(media_msgs) / len(df)
+            media_msgs = sum(type_counts[t] for t in media_types)
+            media_ratio = media_msgs / len(df)
 
             # 语音消息特别加分（显示亲密）
-            voice_msgs = len(df[df['Type'] == 34])
+            voice_msgs = type_counts[34]
             voice_ratio = voice_msgs / len(df)
 
             # 多媒体得分（15%多媒体良好）
@@ -450,14 +587,16 @@ class RelationAnalyzer:
             print(f"计算情感分数时出错: {e}")
             return {'total': 0.5, 'details': details}
 
-    def _calculate_depth_score_v2(self, df: pd.DataFrame, stats: Dict) -> Dict:
+    def _calculate_depth_score_v2(self, df: pd.DataFrame, stats: Dict, text_messages: pd.Series,
+                                  text_lengths: np.ndarray, day_counts: np.ndarray,
+                                  type_counts: Dict[int, int]) -> Dict:
         """计算深度维度得分 - 新版本"""
         details = {}
 
         try:
             # 1. 分享行为（链接、文件、位置等）
             share_types = [49]
-            share_count = len(df[df['Type'].isin(share_types)])
+            share_count = sum(type_counts[t] for t in share_types)
             share_ratio = share_count / len(df)
 
             # 分享得分（5%分享良好）
@@ -467,26 +606,16 @@ class RelationAnalyzer:
             details['share_ratio'] = round(share_ratio, 3)
 
             # 2. 对话深度（长消息、引用回复）
-            text_messages = df[df['Type'] == 1]['Content'].dropna()
-
             if not text_messages.empty:
                 # 长消息（超过50字）
-                long_messages = sum(1 for msg in text_messages if len(str(msg)) > 50)
+                long_messages = int((text_lengths > 50).sum())
                 long_msg_ratio = long_messages / len(text_messages)
 
-                # 计算对话连续性（连续多条消息）
-                conversation_chains = 0
-                last_sender = None
-                chain_length = 0
-
-                for sender in df['IsSender'].values[:1000]:
-                    if sender == last_sender:
-                        chain_length += 1
-                        if chain_length >= 3:
-                            conversation_chains += 1
-                    else:
-                        chain_length = 1
-                        last_sender = sender
+                # 计算对话连续性（同一发送方连续多条消息，长度为L的连续段计 L-2 次）
+                senders = df['IsSender'].to_numpy()[:1000]
+                breaks = np.flatnonzero(np.diff(senders) != 0) + 1
+                runs = np.diff(np.concatenate(([0], breaks, [len(senders)])))
+                conversation_chains = int(np.clip(runs - 2, 0, None).sum())
 
                 chain_ratio = conversation_chains / min(len(df), 1000)
 
@@ -503,10 +632,8 @@ class RelationAnalyzer:
             details['conversation_chains'] = conversation_chains
 
             # 3. 特殊时刻交流（节日、深夜）
-            dates = df['CreateTime'].dt.date.value_counts()
-
             # 超高频日期（特殊事件）
-            special_days = len(dates[dates > stats['total_messages'] / stats['total_days'] * 3])
+            special_days = int((day_counts > stats['total_messages'] / stats['total_days'] * 3).sum())
             special_day_score = min(special_days / 10, 1.0)
 
             details['special_days'] = special_days
@@ -569,34 +696,52 @@ class RelationAnalyzer:
             df['CreateTime'] = pd.to_datetime(df['CreateTime'], unit='s', errors='coerce')
 
             # 移除无效时间戳的行
-            df = df.dropna(subset=['CreateTime'])
-
-            # 解析压缩内容
-            def decompress_content(row):
-                try:
-                    if row['Type'] == 49 and row.get('SubType') == 57 and pd.notna(row.get('CompressContent')):
-                        if HAS_LZ4:
-                            try:
-                                unzipped = lb.decompress(row['CompressContent'], uncompressed_size=0x10004)
-                                return unzipped.decode('utf-8', errors='ignore')
-                            except:
-                                pass
-                        return row.get('StrContent', '')
-                    return row.get('StrContent', '')
-                except:
-                    return row.get('StrContent', '')
-
-            df['Content'] = df.apply(decompress_content, axis=1)
+            df = df.dropna(subset=['CreateTime']).copy()
+
+            # 预先计算日期序数和小时，供各评分函数复用
+            df['_DateOrd'] = df['CreateTime'].values.astype('datetime64[D]').astype(np.int64) + EPOCH_ORD
+            df['_Hour'] = df['CreateTime'].dt.hour.astype(np.int8)
+
+            # 默认使用文本内容
+            df['Content'] = df['StrContent'] if 'StrContent' in df.columns else ''
+
+            # 仅对引用消息（Type=49, SubType=57）解析压缩内容
+            if HAS_LZ4 and 'SubType' in df.columns and 'CompressContent' in df.columns:
+                compress_bufs = df['CompressContent'].to_numpy()
+                quote_idx = np.flatnonzero(
+                    (df['Type'].to_numpy() == 49) &
+                    (df['SubType'].to_numpy() == 57) &
+                    df['CompressContent'].notna().to_numpy()
+                )
+                if quote_idx.size > 0:
+                    contents = df['Content'].to_numpy(dtype=object, copy=True)
+                    for i in quote_idx:
+                        try:
+                            unzipped = lb.decompress(compress_bufs[i], uncompressed_size=0x10004)
+                            contents[i] = unzipped.decode('utf-8', errors='ignore')
+                        except:
+                            pass  # 解压失败时保留StrContent
+                    df['Content'] = contents
+
+            # 统一转为字符串，缺失值保持为None（NaN为真值，会被当作有内容），后续评分函数无需再逐条转换
+            content = df['Content']
+            df['Content'] = content.astype(str).where(content.notna(), None)
 
             # 过滤系统消息，保留主要消息类型
-            df = df[df['Type'].isin([1, 3, 34, 43, 47, 49])]
+            df = df[df['Type'].isin(MESSAGE_TYPES)]
+
+            # 过滤后类型和发送方取值都很小，压缩为int8以减少后续比较的扫描量；含缺失值的列保持原样，不影响评分结果
+            narrow = {col: np.int8 for col in ('Type', 'IsSender') if df[col].notna().all()}
+            if narrow:
+                df = df.astype(narrow, copy=False)
 
             return df
         except Exception as e:
             print(f"预处理消息时出错: {e}")
             return pd.DataFrame()
 
-    def _extract_milestones(self, df: pd.DataFrame) -> List[Dict]:
+    def _extract_milestones(self, df: pd.DataFrame, hour_counts: np.ndarray, day_ords: np.ndarray,
+                            day_counts: np.ndarray, streak: tuple) -> List[Dict]:
         """提取关系里程碑"""
         milestones = []
 
@@ -614,31 +759,19 @@ class RelationAnalyzer:
             })
 
             # 2. 聊天最频繁的一天
-            daily_counts = df.groupby(df['CreateTime'].dt.date).size()
-            if not daily_counts.empty:
-                busiest_day = daily_counts.idxmax()
+            if len(day_counts) > 0:
+                busiest_idx = int(day_counts.argmax())
+                busiest_day = date.fromordinal(int(day_ords[busiest_idx]))
                 milestones.append({
                     'type': 'busiest_day',
                     'date': busiest_day.strftime('%Y-%m-%d'),
                     'description': f'聊天最活跃的一天',
-                    'content': f'共交换了 {daily_counts.max()} 条消息'
+                    'content': f'共交换了 {int(day_counts[busiest_idx])} 条消息'
                 })
 
             # 3. 最长连续对话
-            dates = sorted(df['CreateTime'].dt.date.unique())
-            max_streak = 1
-            current_streak = 1
-            streak_start = dates[0] if dates else None
-
-            for i in range(1, len(dates)):
-                if (dates[i] - dates[i - 1]).days <= 1:
-                    current_streak += 1
-                    if current_streak > max_streak:
-                        max_streak = current_streak
-                        streak_end = dates[i]
-                        streak_start = dates[i - current_streak + 1]
-                else:
-                    current_streak = 1
+            max_streak, start_idx, _ = streak
+            streak_start = date.fromordinal(int(day_ords[start_idx])) if len(day_ords) else None
 
             if max_streak >= 7 and streak_start:
                 milestones.append({
@@ -649,13 +782,13 @@ class RelationAnalyzer:
                 })
 
             # 4. 深夜畅谈
-            late_night = df[(df['CreateTime'].dt.hour >= 1) & (df['CreateTime'].dt.hour <= 5)]
-            if len(late_night) > 20:
+            late_night = int(hour_counts[1:6].sum())
+            if late_night > 20:
                 milestones.append({
                     'type': 'late_night',
                     'date': '',
                     'description': '深夜畅谈者',
-                    'content': f'你们有 {len(late_night)} 条深夜消息（凌晨1-5点）'
+                    'content': f'你们有 {late_night} 条深夜消息（凌晨1-5点）'
                 })
 
             # 5. 里程碑消息数
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
@@ -7,14 +8,23 @@ import uvicorn
 import numpy as np
 from collections import defaultdict
 import calendar
+import orjson
 import pandas as pd
 import re
-
-from database import WeChatDB
+import os
+import asyncio
+import multiprocessing
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from cachetools import TTLCache
+
+from database import WeChatDB, SQL_PARAM_CHUNK
 from analyzer import RelationAnalyzer
 from config import Config
 
-app = FastAPI(title="RScore API", version="1.0.0")
+# 所有接口统一用orjson序列化（支持NumPy标量和非字符串键）
+app = FastAPI(title="RScore API", version="1.0.0", default_response_class=ORJSONResponse)
 
 # 配置CORS
 app.add_middleware(
@@ -29,6 +39,13 @@ app.add_middleware(
 db: Optional[WeChatDB] = None
 analyzer: Optional[RelationAnalyzer] = None
 config: Optional[Config] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+# 结果缓存：键为 (联系人, MSG数据库最新修改时间)，数据库写入新消息后自动失效
+# 只缓存结果字典，不缓存DataFrame；仅在事件循环线程中读写
+_report_cache: TTLCache = TTLCache(maxsize=256, ttl=Config.CACHE_EXPIRE)
+_score_cache: TTLCache = TTLCache(maxsize=4096, ttl=Config.CACHE_EXPIRE)
+_MISSING = object()
 
 
 @app.on_event("startup")
@@ -297,58 +314,248 @@ def _compute_achievements(messages: pd.DataFrame, inter: Dict) -> List[Dict]:
     ]
 
 
+def _build_report(messages: pd.DataFrame) -> Dict:
+    """计算单个联系人的完整报告：关系评分 + 互动分析 + 成就（阻塞调用，需放到线程中执行）"""
+    result = analyzer.calculate_rscore(messages)
+    inter = _compute_interaction_analysis(messages)
+    result["interaction_analysis"] = inter
+    result["achievements"] = _compute_achievements(messages, inter)
+    return result
+
+
+def _db_version() -> float:
+    """MSG数据库的最新修改时间，作为缓存键的一部分"""
+    return max((os.path.getmtime(p) for p in Config.get_msg_databases()), default=0.0)
+
+
+async def _get_report(user_name: str) -> Optional[Dict]:
+    """获取单个联系人的完整报告（带缓存）；没有聊天记录时返回None"""
+    key = (user_name, await asyncio.to_thread(_db_version))
+    result = _report_cache.get(key, _MISSING)
+    if result is _MISSING:
+        messages = await asyncio.to_thread(db.get_chat_messages, user_name)
+        result = None if messages.empty else await asyncio.to_thread(_build_report, messages)
+        _report_cache[key] = result
+    return result
+
+
+# =========================
+# 批量评分（多进程）
+# =========================
+def _init_worker():
+    """子进程初始化：每个进程独立打开数据库连接，SQLite连接不跨进程传递"""
+    global db, analyzer
+    # 子进程只需读取聊天记录：不建索引、不连接联系人/媒体数据库
+    db = WeChatDB(msg_only=True)
+    analyzer = RelationAnalyzer()
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    """懒加载进程池，整个服务生命周期内复用"""
+    global _process_pool
+    if _process_pool is None:
+        # 使用spawn启动子进程（Windows默认方式）：子进程不继承主进程已打开的SQLite连接和线程状态
+        # 子进程启动后常驻到服务退出（每个进程都加载了jieba和pandas），进程数由Config.BATCH_MAX_WORKERS限制
+        _process_pool = ProcessPoolExecutor(
+            max_workers=Config.BATCH_MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+    return _process_pool
+
+
+def _discard_process_pool(pool: ProcessPoolExecutor):
+    """子进程异常退出后进程池不可再用，丢弃后下次请求重新创建"""
+    global _process_pool
+    if _process_pool is pool:
+        _process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _collect_time_data(messages: pd.DataFrame) -> List[Dict]:
+    """按（星期, 小时, 年, 月）聚合消息数，供热力图/趋势分析使用"""
+    dt = _ensure_datetime_series(messages["CreateTime"]).dropna()
+    if dt.empty:
+        return []
+    counts = pd.DataFrame(
+        {"weekday": dt.dt.weekday, "hour": dt.dt.hour, "year": dt.dt.year, "month": dt.dt.month}
+    ).value_counts(sort=False)
+    return [
+        {"weekday": int(w), "hour": int(h), "month": f"{y:04d}-{m:02d}", "year": int(y), "count": int(c)}
+        for (w, h, y, m), c in counts.items()
+    ]
+
+
+def _score_messages(user_name: str, display_name: str, messages: pd.DataFrame):
+    """分析单个联系人，返回 (评分条目, 时间数据)"""
+    result = analyzer.calculate_rscore_arrays(
+        messages["CreateTime"].to_numpy(),
+        messages["IsSender"].to_numpy(),
+        messages["Type"].to_numpy(),
+        messages["SubType"].to_numpy(),
+        messages["StrContent"].to_numpy(),
+        messages["CompressContent"].to_numpy(),
+    )
+    entry = {
+        "user_name": user_name,
+        "display_name": display_name,
+        "score": result["total_score"],
+        "message_count": result["statistics"]["total_messages"],
+        "days": result["statistics"].get("total_days", 0),
+        "last_chat": result["statistics"].get("last_chat_date", ""),
+        "relationship_status": result.get("relationship_status", "未知"),
+        "freshness": result.get("freshness", 0),
+        "dimensions": result["dimensions"],
+    }
+
+    # 时间数据（热力图/趋势）
+    try:
+        time_data = _collect_time_data(messages)
+    except Exception as e:
+        print(f"处理时间数据时出错: {e}")
+        time_data = []
+
+    return entry, time_data
+
+
+def _score_many(contacts: List[tuple]) -> List[tuple]:
+    """
+    分析一组联系人（在子进程中执行）
+    整组聊天记录一次查询取回，再逐个评分；返回与contacts等长的 (结果, 错误信息) 列表，
+    没有聊天记录的联系人结果为None
+    """
+    grouped = db.get_all_chat_messages([user_name for user_name, _ in contacts])
+    out = []
+    for user_name, display_name in contacts:
+        messages = grouped.get(user_name)
+        if messages is None:
+            out.append((None, None))
+            continue
+        try:
+            out.append((_score_messages(user_name, display_name, messages), None))
+        except Exception as e:
+            out.append((None, str(e)))
+    return out
+
+
+async def _iter_scored_contacts(contacts_to_analyze: List[Dict]):
+    """
+    逐个产出一组联系人的评分结果（带缓存），顺序为完成顺序
+    每项为 (下标, 结果, 错误)；结果为 (评分条目, 时间数据)，没有聊天记录时为None
+    """
+    total = len(contacts_to_analyze)
+
+    # 已缓存的联系人直接取结果，其余按组分发到进程池；每组在子进程内一次批量取数
+    loop = asyncio.get_running_loop()
+    executor = _get_process_pool()
+    version = await asyncio.to_thread(_db_version)
+
+    pending = []
+    for idx, contact in enumerate(contacts_to_analyze):
+        scored = _score_cache.get((contact["UserName"], contact["DisplayName"], version), _MISSING)
+        if scored is _MISSING:
+            pending.append(idx)
+        else:
+            yield idx, scored, None
+
+    # 每个进程约分到4组，单组不超过SQL_PARAM_CHUNK人，控制单次取数的内存
+    chunk_size = max(1, min(SQL_PARAM_CHUNK, -(-len(pending) // (Config.BATCH_MAX_WORKERS * 4))))
+
+    async def score(indices):
+        batch = [(contacts_to_analyze[i]["UserName"], contacts_to_analyze[i]["DisplayName"]) for i in indices]
+        try:
+            return indices, await loop.run_in_executor(executor, _score_many, batch), None
+        except BrokenProcessPool as e:
+            _discard_process_pool(executor)
+            return indices, None, e
+        except Exception as e:
+            return indices, None, e
+
+    tasks = [score(pending[i:i + chunk_size]) for i in range(0, len(pending), chunk_size)]
+    done = total - len(pending)
+
+    for task in asyncio.as_completed(tasks):
+        indices, outcomes, error = await task
+        if error is not None:
+            outcomes = [(None, error)] * len(indices)
+        for idx, (scored, err) in zip(indices, outcomes):
+            contact = contacts_to_analyze[idx]
+            if err is not None:
+                print(f"分析 {contact.get('DisplayName', 'Unknown')} 时出错: {err}")
+            else:
+                _score_cache[(contact["UserName"], contact["DisplayName"], version)] = scored
+            yield idx, scored, err
+
+        done += len(indices)
+        print(f"分析进度: {done}/{total} ({done * 100 / total:.1f}%)")
+
+
+async def _scored_contacts_cached(contacts_to_analyze: List[Dict]):
+    """
+    获取一组联系人的评分结果，batch_analysis 与 user_preference_analysis 共用
+    返回 (与contacts_to_analyze等长的结果列表, 失败数)
+    """
+    results = [None] * len(contacts_to_analyze)
+    failed_count = 0
+    async for idx, scored, error in _iter_scored_contacts(contacts_to_analyze):
+        if error is not None:
+            failed_count += 1
+        else:
+            results[idx] = scored
+    return results, failed_count
+
+
+# 评分维度
+DIMENSIONS = ["interaction", "content", "emotion", "depth"]
+
+# 评分分布的分段边界与标签
+SCORE_BUCKET_EDGES = [0, 2, 4, 6, 8, 10]
+SCORE_BUCKET_LABELS = ["0-2", "2-4", "4-6", "6-8", "8-10"]
+
+
 # =========================
 # 其余分析（来自你原始实现）
 # =========================
+# 分类阈值：score < 4 为泛社交，[4, 6) 工作圈，[6, 8) 社交圈，>= 8 密友圈
+CATEGORY_THRESHOLDS = [4, 6, 8]
+CATEGORY_NAMES = ["泛社交", "工作圈", "社交圈", "密友圈"]
+
+
 def categorize_relationships(scores):
     """将好友关系分类"""
     categories = {"密友圈": [], "社交圈": [], "工作圈": [], "泛社交": []}
-    for friend in scores:
-        if friend["score"] >= 8:
-            categories["密友圈"].append(friend)
-        elif friend["score"] >= 6:
-            categories["社交圈"].append(friend)
-        elif friend["score"] >= 4:
-            categories["工作圈"].append(friend)
-        else:
-            categories["泛社交"].append(friend)
+    if scores:
+        values = np.fromiter((s["score"] for s in scores), dtype=np.float64, count=len(scores))
+        buckets = np.digitize(values, CATEGORY_THRESHOLDS)
+        for b, name in enumerate(CATEGORY_NAMES):
+            categories[name] = [scores[i] for i in np.flatnonzero(buckets == b)]
     return {
         "categories": categories,
-        "summary": {
-            "密友圈": len(categories["密友圈"]),
-            "社交圈": len(categories["社交圈"]),
-            "工作圈": len(categories["工作圈"]),
-            "泛社交": len(categories["泛社交"]),
-        },
+        "summary": {name: len(members) for name, members in categories.items()},
     }
 
 
-def analyze_user_preference(all_dimensions, analyzed_count):
-    """分析用户偏好（内部函数）"""
+def analyze_user_preference(dim_arr, analyzed_count):
+    """分析用户偏好（内部函数）；dim_arr 为 (人数, 4) 的维度得分矩阵，列顺序同 DIMENSIONS"""
     if analyzed_count == 0:
         return {"user_type": "未知", "preferences": {}, "description": "数据不足，无法分析", "analyzed_count": 0}
 
-    preference = {}
-    for dim, scores in all_dimensions.items():
-        if scores:
-            avg = np.mean(scores)
-            std = np.std(scores)
-            preference[dim] = {"average": round(avg, 2), "std": round(std, 2), "strength": round(avg / 10, 2)}
-        else:
-            preference[dim] = {"average": 0, "std": 0, "strength": 0}
+    means = dim_arr.mean(axis=0)
+    stds = dim_arr.std(axis=0)
+    preference = {
+        dim: {"average": round(float(avg), 2), "std": round(float(std), 2), "strength": round(float(avg) / 10, 2)}
+        for dim, avg, std in zip(DIMENSIONS, means, stds)
+    }
 
-    if preference:
-        max_dim = max(preference.items(), key=lambda x: x[1]["average"])
-        dim_names = {"interaction": "互动频率", "content": "内容质量", "emotion": "情感表达", "depth": "深度交流"}
-        user_types = {"interaction": "互动型", "content": "深度型", "emotion": "情感型", "depth": "分享型"}
-        return {
-            "user_type": user_types[max_dim[0]],
-            "preferences": preference,
-            "description": f"基于{analyzed_count}位好友的分析，你是一个{user_types[max_dim[0]]}社交者，最注重{dim_names[max_dim[0]]}",
-            "analyzed_count": analyzed_count,
-        }
-    else:
-        return {"user_type": "未知", "preferences": preference, "description": "数据不足", "analyzed_count": analyzed_count}
+    top_dim = DIMENSIONS[int(np.argmax(means))]
+    dim_names = {"interaction": "互动频率", "content": "内容质量", "emotion": "情感表达", "depth": "深度交流"}
+    user_types = {"interaction": "互动型", "content": "深度型", "emotion": "情感型", "depth": "分享型"}
+    return {
+        "user_type": user_types[top_dim],
+        "preferences": preference,
+        "description": f"基于{analyzed_count}位好友的分析，你是一个{user_types[top_dim]}社交者，最注重{dim_names[top_dim]}",
+        "analyzed_count": analyzed_count,
+    }
 
 
 def analyze_time_patterns(all_time_data):
@@ -409,7 +616,7 @@ def analyze_time_patterns(all_time_data):
     }
 
 
-def calculate_social_health(scores, all_dimensions, total_contacts):
+def calculate_social_health(scores, dim_arr, total_contacts):
     """计算社交健康度"""
     if not scores:
         return {
@@ -441,8 +648,8 @@ def calculate_social_health(scores, all_dimensions, total_contacts):
     maintenance_index = (active_count / len(scores) * 100) if scores else 0
 
     # 4. 情感表达
-    if all_dimensions and "emotion" in all_dimensions and all_dimensions["emotion"]:
-        emotion_avg = np.mean(all_dimensions["emotion"])
+    if len(dim_arr):
+        emotion_avg = dim_arr[:, DIMENSIONS.index("emotion")].mean()
         emotional_index = min(100, emotion_avg * 10)
     else:
         emotional_index = 50
@@ -536,6 +743,77 @@ def prepare_network_graph_data(scores):
     return {"nodes": nodes, "edges": edges, "categories": categories}
 
 
+def _summarize_batch(results: List, failed_count: int, total_contacts: int, top_n: int = 0) -> Dict:
+    """
+    汇总批量评分结果：统计、分类、偏好、时间模式、社交健康度与网络图
+    results 为按联系人原始顺序排列的评分结果（见 _scored_contacts_cached）
+    """
+    scores = []
+    all_time_data = []
+    analyzed_count = 0
+
+    # 各维度得分预分配为 (人数, 4) 的矩阵，逐行填充
+    dim_arr = np.empty((len(results), len(DIMENSIONS)), dtype=np.float64)
+
+    # 按联系人原始顺序汇总，保证结果稳定
+    for scored in results:
+        if scored is None:
+            continue
+        entry, time_data = scored
+        scores.append(entry)
+        dims = entry["dimensions"]
+        dim_arr[analyzed_count] = [dims[dim] for dim in DIMENSIONS]
+        all_time_data.extend(time_data)
+        analyzed_count += 1
+    dim_arr = dim_arr[:analyzed_count]
+
+    # 只取前top_n位时用堆选出排名靠前的部分（网络图另需前50位），避免全量排序；
+    # 此时分类列表内按联系人原始顺序排列
+    graph_n = max(top_n, 50)
+    if 0 < top_n and graph_n < len(scores) // 4:
+        ranked = heapq.nlargest(graph_n, scores, key=lambda x: x["score"])
+    else:
+        scores.sort(key=lambda x: x["score"], reverse=True)
+        ranked = scores
+    print(f"批量分析完成！成功: {analyzed_count}, 失败: {failed_count}")
+
+    if scores:
+        # 一次直方图统计分段人数；最后一段为闭区间，与原 8 <= score <= 10 一致
+        all_scores = np.fromiter((s["score"] for s in scores), dtype=np.float64, count=len(scores))
+        bucket_counts = np.histogram(all_scores, bins=SCORE_BUCKET_EDGES)[0].tolist()
+        statistics = {
+            "average_score": round(float(all_scores.mean()), 2),
+            # 偶数个时取上中位数，保持原有口径
+            "median_score": round(float(np.sort(all_scores)[len(all_scores) // 2]), 2),
+            "score_distribution": dict(zip(SCORE_BUCKET_LABELS, bucket_counts)),
+        }
+    else:
+        statistics = {
+            "average_score": 0,
+            "median_score": 0,
+            "score_distribution": dict.fromkeys(SCORE_BUCKET_LABELS, 0),
+        }
+
+    time_analysis = analyze_time_patterns(all_time_data) if all_time_data else None
+    relationship_categories = categorize_relationships(scores)
+    user_preference = analyze_user_preference(dim_arr, analyzed_count)
+    social_health = calculate_social_health(scores, dim_arr, total_contacts)
+    network_graph = prepare_network_graph_data(ranked)
+
+    return {
+        "top_friends": ranked[:top_n] if top_n > 0 else ranked,
+        "total_contacts": total_contacts,
+        "total_analyzed": analyzed_count,
+        "failed_count": failed_count,
+        "statistics": statistics,
+        "categories": relationship_categories,
+        "user_preference": user_preference,
+        "time_analysis": time_analysis,
+        "social_health": social_health,
+        "network_graph": network_graph,
+    }
+
+
 # =========================
 # 路由
 # =========================
@@ -549,9 +827,10 @@ async def root():
 async def get_contacts():
     """获取所有联系人列表"""
     try:
-        contacts = db.get_contacts()
+        contacts = await asyncio.to_thread(db.get_contacts)
+        # 数据来自本地数据库而非用户输入，跳过构造时的校验（响应仍按response_model输出）
         return [
-            ContactResponse(
+            ContactResponse.model_construct(
                 user_name=c["UserName"],
                 display_name=c["DisplayName"],
                 nick_name=c.get("NickName"),
@@ -567,18 +846,13 @@ async def get_contacts():
 async def calculate_rscore(request: RScoreRequest):
     """计算关系评分 + 互动分析 + 成就系统"""
     try:
-        messages = db.get_chat_messages(request.user_name)
-        if messages.empty:
+        # 评分 + 互动分析 + 成就
+        result = await _get_report(request.user_name)
+        if result is None:
             raise HTTPException(status_code=404, detail="未找到该联系人的聊天记录")
 
-        result = analyzer.calculate_rscore(messages)
-
-        # 新增：互动分析 + 成就
-        inter = _compute_interaction_analysis(messages)
-        result["interaction_analysis"] = inter
-        result["achievements"] = _compute_achievements(messages, inter)
-
-        return RScoreResponse(**result)
+        # 结果由分析器生成，跳过构造时的校验
+        return RScoreResponse.model_construct(**result)
     except HTTPException:
         raise
     except Exception as e:
@@ -589,127 +863,68 @@ async def calculate_rscore(request: RScoreRequest):
 async def batch_analysis(top_n: int = 0, limit: int = 0):
     """综合批量分析 - 包含所有分析"""
     try:
-        contacts = db.get_contacts()
-
-        scores = []
-        all_dimensions = {"interaction": [], "content": [], "emotion": [], "depth": []}
-        all_time_data = []
+        contacts = await asyncio.to_thread(db.get_contacts)
 
         contacts_to_analyze = contacts if limit <= 0 else contacts[:limit]
-        total_contacts = len(contacts_to_analyze)
-        analyzed_count = 0
-        failed_count = 0
-
-        print(f"开始综合批量分析 {total_contacts} 位联系人...")
-
-        for i, contact in enumerate(contacts_to_analyze, 1):
-            try:
-                if i % 10 == 0 or i == total_contacts:
-                    print(f"分析进度: {i}/{total_contacts} ({i * 100 / total_contacts:.1f}%)")
-
-                messages = db.get_chat_messages(contact["UserName"])
-                if not messages.empty:
-                    result = analyzer.calculate_rscore(messages)
-                    scores.append(
-                        {
-                            "user_name": contact["UserName"],
-                            "display_name": contact["DisplayName"],
-                            "score": result["total_score"],
-                            "message_count": result["statistics"]["total_messages"],
-                            "days": result["statistics"].get("total_days", 0),
-                            "last_chat": result["statistics"].get("last_chat_date", ""),
-                            "relationship_status": result.get("relationship_status", "未知"),
-                            "freshness": result.get("freshness", 0),
-                            "dimensions": result["dimensions"],
-                        }
-                    )
-
-                    for dim in all_dimensions:
-                        all_dimensions[dim].append(result["dimensions"][dim])
-
-                    # 时间数据（热力图/趋势）
-                    try:
-                        msgs = messages.copy()
-                        if "CreateTime" not in msgs.columns:
-                            msgs["CreateTime"] = pd.to_datetime(messages["CreateTime"], unit="s", errors="coerce")
-                        else:
-                            msgs["CreateTime"] = pd.to_datetime(msgs["CreateTime"], errors="coerce")
-
-                        for _, msg in msgs.iterrows():
-                            if pd.notna(msg["CreateTime"]):
-                                all_time_data.append(
-                                    {
-                                        "weekday": msg["CreateTime"].weekday(),
-                                        "hour": msg["CreateTime"].hour,
-                                        "month": msg["CreateTime"].strftime("%Y-%m"),
-                                        "year": msg["CreateTime"].year,
-                                        "count": 1,
-                                    }
-                                )
-                    except Exception as e:
-                        print(f"处理时间数据时出错: {e}")
-
-                    analyzed_count += 1
-
-            except Exception as e:
-                print(f"分析 {contact.get('DisplayName', 'Unknown')} 时出错: {e}")
-                failed_count += 1
-                continue
+        print(f"开始综合批量分析 {len(contacts_to_analyze)} 位联系人...")
 
-        scores.sort(key=lambda x: x["score"], reverse=True)
-        print(f"批量分析完成！成功: {analyzed_count}, 失败: {failed_count}")
-
-        if scores:
-            all_scores = [s["score"] for s in scores]
-            all_scores_sorted = sorted(all_scores)
-            median_index = len(all_scores_sorted) // 2
-            statistics = {
-                "average_score": round(sum(all_scores) / len(all_scores), 2),
-                "median_score": round(all_scores_sorted[median_index], 2) if all_scores_sorted else 0,
-                "score_distribution": {
-                    "0-2": len([s for s in scores if s["score"] < 2]),
-                    "2-4": len([s for s in scores if 2 <= s["score"] < 4]),
-                    "4-6": len([s for s in scores if 4 <= s["score"] < 6]),
-                    "6-8": len([s for s in scores if 6 <= s["score"] < 8]),
-                    "8-10": len([s for s in scores if 8 <= s["score"] <= 10]),
-                },
-            }
-        else:
-            statistics = {
-                "average_score": 0,
-                "median_score": 0,
-                "score_distribution": {"0-2": 0, "2-4": 0, "4-6": 0, "6-8": 0, "8-10": 0},
-            }
-
-        time_analysis = analyze_time_patterns(all_time_data) if all_time_data else None
-        relationship_categories = categorize_relationships(scores)
-        user_preference = analyze_user_preference(all_dimensions, analyzed_count)
-        social_health = calculate_social_health(scores, all_dimensions, len(contacts))
-        network_graph = prepare_network_graph_data(scores)
-
-        return {
-            "top_friends": scores[:top_n] if top_n > 0 else scores,
-            "total_contacts": len(contacts),
-            "total_analyzed": analyzed_count,
-            "failed_count": failed_count,
-            "statistics": statistics,
-            "categories": relationship_categories,
-            "user_preference": user_preference,
-            "time_analysis": time_analysis,
-            "social_health": social_health,
-            "network_graph": network_graph,
-        }
+        results, failed_count = await _scored_contacts_cached(contacts_to_analyze)
+        return _summarize_batch(results, failed_count, len(contacts), top_n)
     except Exception as e:
         print(f"批量分析出错: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/batch_analysis/stream")
+async def batch_analysis_stream(top_n: int = 0, limit: int = 0):
+    """
+    流式批量分析（NDJSON）：每完成一位联系人输出一行 {"type": "friend", "data": 评分条目}，
+    最后一行为 {"type": "summary", "data": 汇总}，内容同 /api/batch_analysis，但不再重复各联系人条目
+    """
+    contacts = await asyncio.to_thread(db.get_contacts)
+    contacts_to_analyze = contacts if limit <= 0 else contacts[:limit]
+    print(f"开始流式批量分析 {len(contacts_to_analyze)} 位联系人...")
+
+    def line(kind: str, data) -> bytes:
+        return orjson.dumps({"type": kind, "data": data}, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) + b"\n"
+
+    async def generate():
+        try:
+            results = [None] * len(contacts_to_analyze)
+            failed_count = 0
+            async for idx, scored, error in _iter_scored_contacts(contacts_to_analyze):
+                if error is not None:
+                    failed_count += 1
+                elif scored is not None:
+                    results[idx] = scored
+                    yield line("friend", scored[0])
+
+            summary = _summarize_batch(results, failed_count, len(contacts), top_n)
+            summary.pop("top_friends")
+            summary["categories"] = {"summary": summary["categories"]["summary"]}
+            yield line("summary", summary)
+        except Exception as e:
+            # 响应头已发送，错误只能作为最后一行返回
+            print(f"流式批量分析出错: {e}")
+            yield line("error", str(e))
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 @app.get("/api/user_preference_analysis")
 async def user_preference_analysis(limit: int = 30):
     """独立的用户偏好分析（保持兼容）"""
     try:
-        result = await batch_analysis(top_n=0, limit=limit)
-        return result.get("user_preference", {})
+        contacts = await asyncio.to_thread(db.get_contacts)
+        contacts_to_analyze = contacts if limit <= 0 else contacts[:limit]
+
+        # 直接复用缓存的评分结果，只对四个维度做向量化汇总
+        results, _ = await _scored_contacts_cached(contacts_to_analyze)
+        entries = [scored[0] for scored in results if scored is not None]
+        dim_arr = np.empty((len(entries), len(DIMENSIONS)), dtype=np.float64)
+        for k, e in enumerate(entries):
+            dim_arr[k] = [e["dimensions"][dim] for dim in DIMENSIONS]
+        return analyze_user_preference(dim_arr, len(entries))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -718,16 +933,10 @@ async def user_preference_analysis(limit: int = 30):
 async def export_report(user_name: str):
     """导出关系分析报告（包含本次新增两个字段）"""
     try:
-        messages = db.get_chat_messages(user_name)
-        if messages.empty:
+        result = await _get_report(user_name)
+        if result is None:
             raise HTTPException(status_code=404, detail="未找到该联系人的聊天记录")
 
-        result = analyzer.calculate_rscore(messages)
-        inter = _compute_interaction_analysis(messages)
-        achievements = _compute_achievements(messages, inter)
-        result["interaction_analysis"] = inter
-        result["achievements"] = achievements
-
         return {"type": "json", "data": result, "export_date": datetime.now().isoformat()}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -735,7 +944,9 @@ async def export_report(user_name: str):
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """关闭数据库连接"""
+    """关闭进程池和数据库连接"""
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
     if db:
         db.close()
 
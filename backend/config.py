@@ -1,5 +1,7 @@
 import os
+import functools
 from pathlib import Path
+import numpy as np
 
 
 class Config:
@@ -18,15 +20,21 @@ class Config:
     MEDIA_MSG_DB = MSG_DIR / "MediaMsg.db"  # 媒体数据库在Msg目录
 
     @classmethod
+    @functools.lru_cache(maxsize=None)
     def get_msg_databases(cls):
-        """动态获取所有MSG数据库文件"""
+        """动态获取所有MSG数据库文件（结果缓存，新增数据库文件后需调用invalidate_db_list）"""
         msg_files = []
         if cls.MULTI_DIR.exists():
             # 查找所有MSG*.db文件，但排除FTS开头的
             for file in cls.MULTI_DIR.glob("MSG*.db"):
                 if not file.name.startswith("FTS"):
                     msg_files.append(file)
-        return sorted(msg_files)  # 按名称排序确保MSG0在MSG1前面
+        return tuple(sorted(msg_files))  # 按名称排序确保MSG0在MSG1前面；返回元组避免缓存结果被修改
+
+    @classmethod
+    def invalidate_db_list(cls):
+        """清除MSG数据库文件列表缓存，下次调用get_msg_databases时重新扫描目录"""
+        cls.get_msg_databases.cache_clear()
 
     # 评分权重配置
     WEIGHTS = {
@@ -58,10 +66,24 @@ class Config:
         365: 0.6,  # 6-12个月
         float('inf'): 0.4  # 超过一年
     }
+    # 同一配置的数组形式（按天数升序），供批量计算使用
+    TIME_DECAY_BINS, TIME_DECAY_VALS = (
+        np.array(v, dtype=np.float64) for v in zip(*sorted(TIME_DECAY.items()))
+    )
+
+    @classmethod
+    def decay(cls, ages_days) -> np.ndarray:
+        """按距今天数批量查时间衰减因子：不超过90天为1.0，不超过180天为0.8，依此类推"""
+        idx = np.searchsorted(cls.TIME_DECAY_BINS, ages_days)
+        # NaN会排在末尾之后，按最久远处理
+        return cls.TIME_DECAY_VALS[np.minimum(idx, len(cls.TIME_DECAY_BINS) - 1)]
 
     # API配置
     API_HOST = "0.0.0.0"
     API_PORT = 8000
 
     # 缓存配置
-    CACHE_EXPIRE = 3600  # 1小时
\ No newline at end of file
+    CACHE_EXPIRE = 3600  # 1小时
+
+    # 批量评分配置：进程池的进程数（Windows下ProcessPoolExecutor最多支持61个进程）
+    BATCH_MAX_WORKERS = min(os.cpu_count() or 1, 61)
\ No newline at end of file
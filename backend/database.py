@@ -1,15 +1,51 @@
+import os
 import sqlite3
+import threading
+from contextlib import closing
 from typing import List, Dict, Any
 from pathlib import Path
 import pandas as pd
 from config import Config
 
+# 聊天记录查询的字段列表
+# CompressContent只有引用回复（Type=49, SubType=57）会被解压使用，其余行不取这个大字段
+MSG_COLUMNS = """
+                CreateTime,
+                IsSender,
+                Type,
+                SubType,
+                StrContent,
+                CASE WHEN Type = 49 AND SubType = 57 THEN CompressContent END AS CompressContent,
+                MsgSvrID,
+                StrTalker"""
+
+# MSG库只读连接的参数：临时表放内存、内存映射读取、加大页缓存（仅对当前连接生效）
+MSG_READ_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=1073741824",
+    "PRAGMA cache_size=-262144",
+)
+
+# SQLite单条语句的参数个数上限（旧版本为999），IN查询按此分块
+SQL_PARAM_CHUNK = 900
+
 
 class WeChatDB:
-    def __init__(self):
+    def __init__(self, msg_only: bool = False):
+        """
+        msg_only=True 时只打开MSG数据库的只读连接（批量评分子进程使用）：
+        不建索引、不做读取校验，也不连接联系人/媒体数据库
+        """
         self.config = Config()
         self.connections = {}
-        self._connect_databases()
+        # 联系人列表缓存，MicroMsg.db修改时间变化后失效
+        self._contacts_cache = None
+        self._contacts_mtime = 0
+        self._contacts_lock = threading.Lock()
+        if msg_only:
+            self._connect_msg_databases()
+        else:
+            self._connect_databases()
 
     def _connect_databases(self):
         """连接所有数据库文件"""
@@ -21,7 +57,9 @@ class WeChatDB:
         # 连接每个MSG数据库
         for db_path in msg_databases:
             try:
-                conn = sqlite3.connect(str(db_path), check_same_thread=False)
+                # 索引在打开只读连接前建好（只读连接无法建索引）
+                self._ensure_msg_index(db_path)
+                conn = self._open_msg_db(db_path)
                 self.connections[db_path.name] = conn
                 print(f"成功连接: {db_path.name}")
 
@@ -37,10 +75,7 @@ class WeChatDB:
         # 连接联系人数据库
         if self.config.MICRO_MSG_DB.exists():
             try:
-                self.connections['MicroMsg'] = sqlite3.connect(
-                    str(self.config.MICRO_MSG_DB),
-                    check_same_thread=False
-                )
+                self.connections['MicroMsg'] = self._open_readonly(self.config.MICRO_MSG_DB)
                 print(f"成功连接联系人数据库: MicroMsg.db")
             except Exception as e:
                 print(f"连接MicroMsg.db失败: {e}")
@@ -48,14 +83,52 @@ class WeChatDB:
         # 连接媒体数据库
         if self.config.MEDIA_MSG_DB.exists():
             try:
-                self.connections['MediaMsg'] = sqlite3.connect(
-                    str(self.config.MEDIA_MSG_DB),
-                    check_same_thread=False
-                )
+                self.connections['MediaMsg'] = self._open_readonly(self.config.MEDIA_MSG_DB)
                 print(f"成功连接媒体数据库: MediaMsg.db")
             except Exception as e:
                 print(f"连接MediaMsg.db失败: {e}")
 
+    def _connect_msg_databases(self):
+        """只打开MSG数据库（索引已由主进程在启动时建好）"""
+        for db_path in self.config.get_msg_databases():
+            try:
+                self.connections[db_path.name] = self._open_msg_db(db_path)
+            except Exception as e:
+                print(f"连接 {db_path.name} 失败: {e}")
+
+    def _open_msg_db(self, db_path: Path) -> sqlite3.Connection:
+        """以只读方式打开MSG数据库并设置读优化参数"""
+        conn = self._open_readonly(db_path)
+        for pragma in MSG_READ_PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _open_readonly(self, db_path: Path) -> sqlite3.Connection:
+        """
+        以只读URI方式打开数据库
+        不使用immutable：微信运行时仍会写入这些文件，SQLite需要照常加锁并感知文件变化
+        """
+        uri = db_path.resolve().as_uri() + "?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def _ensure_msg_index(self, db_path: Path):
+        """
+        按 (StrTalker, CreateTime) 建索引，查询单个联系人时无需全表扫描和排序
+        常驻连接为只读，建索引使用单独的短连接（不改动journal模式，避免影响微信自身的写入）
+        """
+        try:
+            with closing(sqlite3.connect(str(db_path))) as conn:
+                exists = conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_msg_talker_time'"
+                ).fetchone()
+                if not exists:
+                    print(f"  - 为 {db_path.name} 创建索引 idx_msg_talker_time ...")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_msg_talker_time ON MSG(StrTalker, CreateTime)")
+                    conn.execute("ANALYZE")
+                    conn.commit()
+        except Exception as e:
+            print(f"  - 为 {db_path.name} 创建索引失败（将按原方式查询）: {e}")
+
     def test_connection(self):
         """测试数据库连接和数据可读性"""
         print("\n=== 数据库连接测试 ===")
@@ -108,13 +181,24 @@ class WeChatDB:
         return len(self.connections) > 0
 
     def get_contacts(self) -> List[Dict]:
-        """获取所有联系人列表"""
+        """获取所有联系人列表（按MicroMsg.db修改时间缓存，返回结果请勿修改）"""
         if 'MicroMsg' not in self.connections:
             print("警告: 未找到联系人数据库")
             return []
 
+        with self._contacts_lock:
+            mtime = os.path.getmtime(self.config.MICRO_MSG_DB)
+            if self._contacts_cache is None or mtime != self._contacts_mtime:
+                self._contacts_cache = self._query_contacts()
+                self._contacts_mtime = mtime
+            return self._contacts_cache
+
+    def _query_contacts(self) -> List[Dict]:
+        """从MicroMsg.db查询联系人列表"""
+        # 显示名：备注名优先，否则使用昵称，都为空时使用UserName
         query = """
-        SELECT UserName, NickName, Remark, PYInitial, RemarkPYInitial 
+        SELECT UserName, NickName, Remark, PYInitial, RemarkPYInitial,
+               COALESCE(NULLIF(Remark, ''), NULLIF(NickName, ''), UserName) AS DisplayName
         FROM Contact 
         WHERE Type = 3 OR (Type > 50 AND Type != 2049)
         ORDER BY NickName
@@ -124,12 +208,7 @@ class WeChatDB:
         cursor.execute(query)
         columns = [desc[0] for desc in cursor.description]
 
-        contacts = []
-        for row in cursor.fetchall():
-            contact = dict(zip(columns, row))
-            # 使用备注名优先，否则使用昵称
-            contact['DisplayName'] = contact['Remark'] or contact['NickName'] or contact['UserName']
-            contacts.append(contact)
+        contacts = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
         print(f"获取到 {len(contacts)} 个联系人")
         return contacts
@@ -142,16 +221,8 @@ class WeChatDB:
             if not db_name.startswith('MSG'):
                 continue
 
-            query = """
-            SELECT 
-                CreateTime,
-                IsSender,
-                Type,
-                SubType,
-                StrContent,
-                CompressContent,
-                MsgSvrID,
-                StrTalker
+            query = f"""
+            SELECT {MSG_COLUMNS}
             FROM MSG 
             WHERE StrTalker = ?
             ORDER BY CreateTime
@@ -172,6 +243,45 @@ class WeChatDB:
 
         return pd.DataFrame()
 
+    def get_all_chat_messages(self, talkers: List[str]) -> Dict[str, pd.DataFrame]:
+        """
+        一次性获取多个联系人的聊天记录
+        每个MSG数据库按IN分块查询，合并后按联系人分组；没有聊天记录的联系人不在返回结果中
+        """
+        all_messages = []
+
+        for db_name, conn in self.connections.items():
+            if not db_name.startswith('MSG'):
+                continue
+
+            for start in range(0, len(talkers), SQL_PARAM_CHUNK):
+                chunk = talkers[start:start + SQL_PARAM_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                query = f"""
+                SELECT {MSG_COLUMNS}
+                FROM MSG 
+                WHERE StrTalker IN ({placeholders})
+                ORDER BY CreateTime
+                """
+
+                try:
+                    df = pd.read_sql_query(query, conn, params=chunk)
+                    if not df.empty:
+                        all_messages.append(df)
+                except Exception as e:
+                    print(f"从 {db_name} 读取消息失败: {e}")
+
+        if not all_messages:
+            return {}
+
+        # 稳定排序保证同一联系人跨库合并后仍按时间有序
+        result = pd.concat(all_messages, ignore_index=True).sort_values('CreateTime', kind='stable')
+        print(f"为 {len(talkers)} 位联系人获取到 {len(result)} 条消息")
+        return {
+            talker: group.reset_index(drop=True)
+            for talker, group in result.groupby('StrTalker', sort=False)
+        }
+
     def close(self):
         """关闭所有数据库连接"""
         for conn in self.connections.values():